@@ -0,0 +1,68 @@
+"""
+Logging handlers for the RTSP recorder.
+
+Kept in a separate module so `rtsp_recorder` only imports
+`logging.handlers` when it actually sets up logging.
+"""
+
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that batches records in a binary write buffer.
+
+    The stock handler writes through a text wrapper and flushes after every
+    record, so each record costs at least one write() syscall. Here records
+    are encoded once into a `buffer_size` byte buffer, which is written out:
+
+    - immediately for records at `flush_level` (WARNING) or above,
+    - every `flush_interval` seconds by a single background flusher thread,
+    - when the buffer fills, on rollover and on close.
+
+    emit() never starts threads or touches an Event, so logging from a
+    signal handler cannot deadlock on a lock the main thread holds.
+
+    This handler must be the only writer of its file: the size check for
+    rollover uses the buffered stream position instead of seeking to the end.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding='utf-8', delay=False,
+                 buffer_size=64 * 1024, flush_level=logging.WARNING, flush_interval=5.0):
+        self.buffer_size = buffer_size
+        self.flush_level = flush_level
+        self.flush_interval = flush_interval
+        super().__init__(filename, 'a', maxBytes, backupCount, encoding, delay)
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def _open(self):
+        return open(self.baseFilename, 'ab', buffering=self.buffer_size)
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + self.terminator).encode(self.encoding, 'backslashreplace')
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() + len(data) >= self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            if record.levelno >= self.flush_level:
+                self.stream.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _flush_periodically(self):
+        # flush() takes the handler lock; an empty buffer costs no syscall
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop_flusher.set()
+        super().close()
@@ -1,28 +1,162 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
 import time
 import signal
+import select
 import logging
-from logging.handlers import RotatingFileHandler
+import shutil
 import subprocess
 import threading
-from datetime import datetime
+from collections import namedtuple
 from pathlib import Path
 import config
 
+try:
+    # Optional: lets the startup check wait on inotify events on Linux
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+def _detect_hwaccel():
+    """Pick an FFmpeg -hwaccel method for HW_ACCELERATION=auto, or None"""
+    if sys.platform == 'darwin':
+        return 'videotoolbox'
+    if os.path.exists('/dev/nvidia0'):
+        return 'cuda'
+    if os.path.exists('/dev/dri/renderD128'):
+        return 'vaapi'
+    return None
+
+# Platform and devices cannot change while we run, so probe them only once
+_HWACCEL_AUTO = _detect_hwaccel()
+
+# user:password@ part of any URL, masked before FFmpeg output is logged
+_URL_CREDENTIALS = re.compile(r'([A-Za-z][A-Za-z0-9+.-]*://)[^/@\s]+@')
+
+def redact_url(url):
+    """Return url with any user:password part replaced by '***'"""
+    scheme, sep, rest = url.partition('://')
+    netloc, slash, path = rest.partition('/')
+    if not sep or '@' not in netloc:
+        return url
+    return scheme + sep + '***@' + netloc.rpartition('@')[2] + slash + path
+
+# Minimum seconds between two dumps of FFmpeg output for the same return code,
+# so a camera outage with fast retries cannot flood the rotating logs
+FFMPEG_TAIL_INTERVAL = 300
+
+# Every segment file is named recording_<HHMMSS>.<OUTPUT_FORMAT>
+SEGMENT_PREFIX = 'recording_'
+
+# Recorder settings, read from `config` once when the recorder is created
+Settings = namedtuple('Settings', [
+    'ffmpeg_binary',
+    'rtsp_url',
+    'output_dir',
+    'output_format',
+    'segment_duration',
+    'hw_acceleration',
+    'rtsp_transport',
+    'disable_audio',
+])
+
+class DirectoryWatcher:
+    """Wait for new entries to appear in a directory.
+
+    Uses inotify (through the optional `inotify_simple` package) on Linux or
+    kqueue on macOS/BSD. When neither is available, wait() just sleeps for a
+    short interval so callers fall back to polling.
+    """
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, path):
+        self._inotify = None
+        self._kqueue = None
+        self._fd = None
+        try:
+            if INotify is not None:
+                self._inotify = INotify()
+                self._inotify.add_watch(path, inotify_flags.CREATE | inotify_flags.MOVED_TO)
+            elif hasattr(select, 'kqueue'):
+                self._fd = os.open(path, os.O_RDONLY)
+                self._kqueue = select.kqueue()
+                self._kqueue.control([select.kevent(
+                    self._fd,
+                    filter=select.KQ_FILTER_VNODE,
+                    flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                    fflags=select.KQ_NOTE_WRITE,
+                )], 0, 0)
+        except OSError:
+            # Out of watches, directory vanished, ... -> poll instead
+            self.close()
+
+    def wait(self, timeout):
+        """Block until the directory changes or `timeout` seconds have passed"""
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(timeout * 1000))
+        elif self._kqueue is not None:
+            self._kqueue.control(None, 1, timeout)
+        else:
+            time.sleep(min(timeout, self.POLL_INTERVAL))
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        if self._kqueue is not None:
+            self._kqueue.close()
+            self._kqueue = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
 class RTSPRecorder:
     def __init__(self):
+        self.settings = Settings(
+            ffmpeg_binary=config.FFMPEG_BINARY,
+            rtsp_url=config.RTSP_URL,
+            output_dir=config.OUTPUT_DIR,
+            output_format=config.OUTPUT_FORMAT,
+            segment_duration=config.SEGMENT_DURATION,
+            hw_acceleration=config.HW_ACCELERATION,
+            rtsp_transport=getattr(config, 'RTSP_TRANSPORT', ''),
+            disable_audio=getattr(config, 'DISABLE_AUDIO', False),
+        )
+        # Values derived from the settings that every restart cycle reuses.
+        # FFMPEG_BINARY may be a bare name like 'ffmpeg': resolve it against
+        # PATH once so each restart execs an absolute path directly.
+        self._ffmpeg_path = os.path.abspath(
+            shutil.which(self.settings.ffmpeg_binary) or self.settings.ffmpeg_binary
+        )
+        self._seg_suffix = '.' + self.settings.output_format
+        self._filename_template = SEGMENT_PREFIX + '%H%M%S' + self._seg_suffix
+        self._seg_duration_str = str(self.settings.segment_duration)
+        self._process_timeout = self.settings.segment_duration + 0.5
+        # Everything but the output file is the same for every FFmpeg run
+        self._cmd_prefix = self.build_ffmpeg_prefix()
         self.setup_logging()
         self.setup_output_directory()
         self.process = None
+        # Dated directory created most recently and the (year, month, day) it is for
+        self._last_date = None
+        self._last_dated_dir = None
         self.running = True
+        # Set (from a helper thread) by signal_handler; waiting on it rather
+        # than sleeping lets the retry backoffs end as soon as a shutdown is
+        # requested.
+        self._stop_event = threading.Event()
         self.clean_shutdown = False
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
 
     def setup_logging(self):
+        # Deferred import: logging.handlers is only needed here, once
+        from logging.handlers import RotatingFileHandler
+        from log_handlers import BufferedRotatingFileHandler
+
         # Ensure logs directory exists
         logs_dir = Path('logs')
         logs_dir.mkdir(parents=True, exist_ok=True)
@@ -41,7 +175,7 @@ class RTSPRecorder:
 
         # Rotating file handler with configurable size and backup count
         log_path = logs_dir / 'rtsp_recorder.log'
-        fh = RotatingFileHandler(
+        fh = BufferedRotatingFileHandler(
             str(log_path),
             maxBytes=config.LOG_MAX_BYTES,
             backupCount=config.LOG_BACKUP_COUNT
@@ -49,15 +183,23 @@ class RTSPRecorder:
         fh.setLevel(logging.INFO)
         fh.setFormatter(formatter)
 
-        # Dedicated ffmpeg rotating file handler (captures full ffmpeg stderr)
-        ffmpeg_log_path = logs_dir / 'ffmpeg.log'
-        ffh = RotatingFileHandler(
-            str(ffmpeg_log_path),
-            maxBytes=config.LOG_MAX_BYTES,
-            backupCount=config.LOG_BACKUP_COUNT
-        )
-        ffh.setLevel(logging.DEBUG if config.ENABLE_FFMPEG_LOG else logging.CRITICAL)  # CRITICAL effectively disables logging
-        ffh.setFormatter(formatter)
+        # FFmpeg writes its stderr straight into ffmpeg.log (see open_ffmpeg_log).
+        # This handler is never attached to a logger; it is only used to
+        # rotate the file between FFmpeg runs.
+        if config.ENABLE_FFMPEG_LOG:
+            self.ffmpeg_log_rotator = RotatingFileHandler(
+                str(logs_dir / 'ffmpeg.log'),
+                maxBytes=config.LOG_MAX_BYTES,
+                backupCount=config.LOG_BACKUP_COUNT,
+                delay=True
+            )
+        else:
+            self.ffmpeg_log_rotator = None
+        self._ffmpeg_log_offset = 0
+        # Return code, time and text of the last FFmpeg output dump (log_ffmpeg_tail)
+        self._last_tail_rc = None
+        self._last_tail_time = None
+        self._last_tail = None
 
         # Remove any existing handlers attached to root logger to avoid duplicates
         if logger.handlers:
@@ -66,46 +208,168 @@ class RTSPRecorder:
         logger.addHandler(ch)
         logger.addHandler(fh)
 
-        # Create a dedicated logger for ffmpeg output and attach the rotating handler.
-        ffmpeg_logger = logging.getLogger('ffmpeg')
-        # Avoid propagating to root logger so ffmpeg logs only go to their file
-        ffmpeg_logger.propagate = False
-        ffmpeg_logger.setLevel(logging.DEBUG)
-        # Remove existing handlers if any (prevents duplicates during reload)
-        if ffmpeg_logger.handlers:
-            ffmpeg_logger.handlers = []
-        ffmpeg_logger.addHandler(ffh)
-
-        # Expose ffmpeg logger on the instance for the stderr reader to use
-        self.ffmpeg_logger = ffmpeg_logger
-
         self.logger = logging.getLogger(__name__)
 
+    def open_ffmpeg_log(self):
+        """Open logs/ffmpeg.log for FFmpeg to write its stderr into.
+
+        FFmpeg keeps the file open while it runs, so size-based rotation is
+        done here, before each run. Returns None if ENABLE_FFMPEG_LOG is off.
+        """
+        rotator = self.ffmpeg_log_rotator
+        if rotator is None:
+            return None
+        try:
+            if rotator.maxBytes > 0 and os.path.getsize(rotator.baseFilename) >= rotator.maxBytes:
+                rotator.doRollover()
+        except OSError:
+            pass
+        ffmpeg_log = open(rotator.baseFilename, 'ab', buffering=0)
+        # Where this run's output starts, for ffmpeg_log_tail()
+        self._ffmpeg_log_offset = ffmpeg_log.tell()
+        return ffmpeg_log
+
+    def ffmpeg_log_tail(self, limit=4096):
+        """Return at most `limit` bytes of the last FFmpeg run's output, decoded.
+
+        Reads only the end of ffmpeg.log, so a run that printed megabytes of
+        diagnostics costs no more than a short one. Returns '' when
+        ENABLE_FFMPEG_LOG is off or nothing was written.
+        """
+        rotator = self.ffmpeg_log_rotator
+        if rotator is None:
+            return ''
+        try:
+            with open(rotator.baseFilename, 'rb') as f:
+                end = f.seek(0, os.SEEK_END)
+                start = max(self._ffmpeg_log_offset, end - limit)
+                f.seek(start)
+                data = f.read(end - start)
+        except OSError:
+            return ''
+        if start > self._ffmpeg_log_offset:
+            # Started mid-line; drop the partial first line
+            data = data.partition(b'\n')[2]
+        return data.decode(errors='replace').rstrip()
+
+    def log_ffmpeg_tail(self, rc):
+        """Log the last lines FFmpeg printed, to explain a failed run.
+
+        A dump is skipped when it repeats the previous one, or when the
+        previous dump for the same return code is less than
+        FFMPEG_TAIL_INTERVAL seconds old. FFmpeg usually repeats the input
+        URL in its errors, so camera credentials are masked before the
+        output reaches our logs.
+        """
+        now = time.monotonic()
+        if rc == self._last_tail_rc and self._last_tail_time is not None \
+                and now - self._last_tail_time < FFMPEG_TAIL_INTERVAL:
+            return
+        tail = self.ffmpeg_log_tail()
+        if not tail:
+            return
+        rtsp_url = self.settings.rtsp_url
+        if rtsp_url:
+            tail = tail.replace(rtsp_url, redact_url(rtsp_url))
+        tail = _URL_CREDENTIALS.sub(r'\1***@', tail)
+        if tail == self._last_tail:
+            return
+        self._last_tail_rc = rc
+        self._last_tail_time = now
+        self._last_tail = tail
+        self.logger.error(f"Last FFmpeg output:\n{tail}")
+
     def setup_output_directory(self):
         """Create base output directory"""
-        Path(config.OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
-
-    def get_dated_output_directory(self):
-        """Generate directory path with year/month/day structure"""
-        now = datetime.now()
-        dated_dir = os.path.join(
-            config.OUTPUT_DIR,
-            now.strftime('%Y'),  # Year folder
-            now.strftime('%m'),  # Month folder
-            now.strftime('%d')   # Day folder
-        )
+        Path(self.settings.output_dir).mkdir(parents=True, exist_ok=True)
+
+    def get_dated_output_directory(self, now=None):
+        """Generate directory path with year/month/day structure
+
+        The directory is only created when the date changes; otherwise the
+        path cached from the previous call is returned as is.
+        """
+        if now is None:
+            now = time.localtime()
+        today = now[:3]  # (year, month, day)
+        if today == self._last_date:
+            return self._last_dated_dir
+        # Year/Month/Day folders
+        dated_dir = os.path.join(self.settings.output_dir, time.strftime('%Y/%m/%d', now))
         Path(dated_dir).mkdir(parents=True, exist_ok=True)
+        self._last_date = today
+        self._last_dated_dir = dated_dir
         return dated_dir
 
-    def get_output_filename(self):
+    def get_output_filename(self, now=None, dated_dir=None):
         """Generate output filename pattern with date-based directory structure"""
-        dated_dir = self.get_dated_output_directory()
-        return os.path.join(dated_dir, datetime.now().strftime(f'recording_%H%M%S.{config.OUTPUT_FORMAT}'))
+        if now is None:
+            now = time.localtime()
+        if dated_dir is None:
+            dated_dir = self.get_dated_output_directory(now)
+        return os.path.join(dated_dir, time.strftime(self._filename_template, now))
+
+    def output_file_state(self, output_file):
+        """Return (inode, mtime_ns, size) of output_file, or None if it does not exist"""
+        try:
+            st = os.stat(output_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def segment_written(self, output_file, before):
+        """Return True if FFmpeg has created or rewritten output_file.
+
+        With '-t' FFmpeg only ever writes the one output file, so a single
+        stat compared with the snapshot taken before it started is enough.
+        Comparing with that snapshot rather than with our own clock keeps
+        this working when the output directory is on a network share.
+        """
+        state = self.output_file_state(output_file)
+        return state is not None and state != before
+
+    def remove_new_segments(self, output_file, before):
+        """Delete output_file if this attempt wrote it; return the removed names"""
+        if not self.segment_written(output_file, before):
+            return []
+        try:
+            os.unlink(output_file)
+        except OSError as e:
+            self.logger.warning(f"Failed removing file {output_file}: {e}")
+            return []
+        deleted = [os.path.basename(output_file)]
+        self.logger.info(f"Removed {len(deleted)} failed/partial segment(s): {deleted}")
+        return deleted
+
+    def wait_for_first_segment(self, output_file, before, watcher):
+        """Wait until FFmpeg creates output_file, exits, or STARTUP_TIMEOUT passes.
+
+        Returns True once the segment file has been written.
+        """
+        STARTUP_TIMEOUT = 20
+        # Upper bound on how long an early FFmpeg exit can go unnoticed
+        EXIT_CHECK_INTERVAL = 0.5
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if self.segment_written(output_file, before):
+                return True
+            # if process has exited quickly, stop waiting and handle it in the caller
+            if self.process.poll() is not None:
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            watcher.wait(min(remaining, EXIT_CHECK_INTERVAL))
 
     def build_ffmpeg_command(self, output_file):
         """Build FFmpeg command with optimized settings for low CPU usage"""
+        return self._cmd_prefix + [output_file]
+
+    def build_ffmpeg_prefix(self):
+        """Build the FFmpeg arguments shared by every run (all but the output file)"""
+        settings = self.settings
         command = [
-            config.FFMPEG_BINARY,
+            self._ffmpeg_path,
             '-y',  # Overwrite output files
             # Reduce probe size and analyzeduration to speed up stream start and lower CPU
             '-analyzeduration', '1M',
@@ -119,39 +383,36 @@ class RTSPRecorder:
         ]
 
         # Add RTSP transport if configured (must come before -i)
-        if getattr(config, 'RTSP_TRANSPORT', ''):
-            command.extend(['-rtsp_transport', config.RTSP_TRANSPORT])
+        if settings.rtsp_transport:
+            command.extend(['-rtsp_transport', settings.rtsp_transport])
 
+        # No '-re' here: an RTSP source is already paced by the camera, so
+        # forcing native-rate reading would only add per-frame clock work.
         command.extend([
             '-hide_banner',
-            '-i', config.RTSP_URL,
+            '-i', settings.rtsp_url,
         ])
 
         # Add hardware acceleration if configured (optional, but often not needed on low-end CPUs)
-        if config.HW_ACCELERATION:
-            if config.HW_ACCELERATION == 'auto':
-                if sys.platform == 'darwin':
-                    command.extend(['-hwaccel', 'videotoolbox'])
-                elif os.path.exists('/dev/nvidia0'):
-                    command.extend(['-hwaccel', 'cuda'])
-                elif os.path.exists('/dev/dri/renderD128'):
-                    command.extend(['-hwaccel', 'vaapi'])
+        if settings.hw_acceleration:
+            if settings.hw_acceleration == 'auto':
+                if _HWACCEL_AUTO:
+                    command.extend(['-hwaccel', _HWACCEL_AUTO])
             else:
-                command.extend(['-hwaccel', config.HW_ACCELERATION])
+                command.extend(['-hwaccel', settings.hw_acceleration])
 
         # Output options
         command.extend([
             '-c:v', 'copy',  # Copy video stream without re-encoding
         ])
         # Optionally disable audio to save CPU
-        if getattr(config, 'DISABLE_AUDIO', False):
+        if settings.disable_audio:
             command.append('-an')
         else:
             command.extend(['-c:a', 'copy'])
         command.extend([
-            '-t', str(config.SEGMENT_DURATION),
+            '-t', self._seg_duration_str,
             '-reset_timestamps', '1',  # Reset timestamps at the beginning of each segment
-            output_file
         ])
 
         return command
@@ -161,95 +422,63 @@ class RTSPRecorder:
         while self.running:
             # Use dated directory and prepare a pattern for FFmpeg to create
             # segmented files (strftime tokens will be expanded by FFmpeg).
-            dated_dir = self.get_dated_output_directory()
-
-            # Snapshot existing files so we can remove any new files created if
-            # FFmpeg exits with an error.
-            try:
-                before_files = set(os.listdir(dated_dir))
-            except FileNotFoundError:
-                before_files = set()
+            now = time.localtime()
+            dated_dir = self.get_dated_output_directory(now)
 
-            output_file = self.get_output_filename()
+            output_file = self.get_output_filename(now, dated_dir)
+            # Snapshot the output file (normally absent) so we can tell whether
+            # this attempt wrote it, and remove it if FFmpeg exits with an error.
+            before = self.output_file_state(output_file)
             command = self.build_ffmpeg_command(output_file)
 
             self.logger.info(
                 f"Starting recording into directory: {dated_dir} | "
                 f"filename: {os.path.basename(output_file)}"
             )
-            def _stream_ffmpeg_stderr(proc, ffmpeg_logger):
-                    """Continuously read FFmpeg stderr and log it to the logger.
-
-                    This prevents the stderr buffer from filling and blocking the
-                    FFmpeg process. Runs in a daemon thread.
-                    """
-                    try:
-                        for raw in iter(proc.stderr.readline, b''):
-                            if not raw:
-                                break
-                            try:
-                                line = raw.decode(errors='replace').rstrip()
-                            except Exception:
-                                line = str(raw)
-                            # Log FFmpeg output as DEBUG to keep main logs cleaner,
-                            # but include as INFO if you prefer.
-                            self.logger.debug(f"ffmpeg: {line}")
-                            # Also write full raw output to the ffmpeg log file so
-                            # we keep an unmodified copy of FFmpeg's stderr.
-                            try:
-                                if ffmpeg_logger:
-                                    # write the decoded line to the ffmpeg logger
-                                    ffmpeg_logger.debug(line)
-                            except Exception:
-                                # Don't let logging failures break the reader loop
-                                pass
-                    except Exception as e:
-                        self.logger.debug(f"stderr reader stopped: {e}")
-
             try:
-                # start ffmpeg process; send stdout to DEVNULL to avoid buffering
-                self.process = subprocess.Popen(
-                    command,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.PIPE
-                )
-
-                # start background thread to drain stderr and write to rotating ffmpeg log
-                t = threading.Thread(target=_stream_ffmpeg_stderr, args=(self.process, self.ffmpeg_logger), daemon=True)
-                t.start()
-
-                # Short startup check: ensure at least one segment file appears
-                # within STARTUP_TIMEOUT seconds, otherwise assume ffmpeg is
-                # stuck and restart.
-                STARTUP_TIMEOUT = 20
-                started_ok = False
-                for _ in range(STARTUP_TIMEOUT):
+                # Watch the directory before FFmpeg starts so the first
+                # segment cannot be created unnoticed.
+                watcher = DirectoryWatcher(dated_dir)
+                try:
+                    # start ffmpeg process; send stdout to DEVNULL to avoid buffering.
+                    # stderr goes straight to ffmpeg.log so no Python code has
+                    # to drain it and a chatty FFmpeg can never block on a full pipe.
+                    ffmpeg_log = self.open_ffmpeg_log()
                     try:
-                        after_files = set(os.listdir(dated_dir))
-                    except FileNotFoundError:
-                        after_files = set()
-
-                    new_files = after_files - before_files
-                    if any(f.startswith('recording_') and f.endswith(f'.{config.OUTPUT_FORMAT}') for f in new_files):
-                        started_ok = True
-                        break
-                    # if process has exited quickly, break and handle below
-                    if self.process.poll() is not None:
-                        break
-                    time.sleep(0.1)
+                        # Every descriptor Python opens is already close-on-exec,
+                        # so skip the close_fds sweep; this also lets subprocess
+                        # use posix_spawn (Python 3.8+) instead of fork + exec.
+                        self.process = subprocess.Popen(
+                            command,
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=ffmpeg_log if ffmpeg_log is not None else subprocess.DEVNULL,
+                            close_fds=False
+                        )
+                    finally:
+                        # FFmpeg has its own copy of the descriptor now
+                        if ffmpeg_log is not None:
+                            ffmpeg_log.close()
+
+                    # Short startup check: ensure at least one segment file appears
+                    # within the startup timeout, otherwise assume ffmpeg is
+                    # stuck and restart.
+                    started_ok = self.wait_for_first_segment(output_file, before, watcher)
+                finally:
+                    watcher.close()
 
                 if not started_ok:
                     # Either no files were created or process exited early.
                     rc = self.process.poll()
                     try:
-                        # attempt to read a small portion of stderr by terminating
-                        # after a short wait to let ffmpeg flush messages
+                        # short wait to let ffmpeg flush its last messages to ffmpeg.log
                         time.sleep(0.1)
                     except Exception:
                         pass
                     if rc is None:
                         # process still running but no output -> kill and restart
                         self.logger.warning("FFmpeg started but produced no segments within timeout; restarting")
+                        self.log_ffmpeg_tail(rc)
                         try:
                             self.process.terminate()
                             self.process.wait(timeout=2)
@@ -258,64 +487,43 @@ class RTSPRecorder:
                                 self.process.kill()
                             except Exception:
                                 pass
-                    else:
+                    elif self.running and not self.clean_shutdown:
+                        # (an exit caused by our own shutdown is not an error)
                         self.logger.error(f"FFmpeg exited early with returncode={rc}; will remove partial files and retry")
+                        self.log_ffmpeg_tail(rc)
 
                     # cleanup any new files from the failed attempt
-                    try:
-                        after_files = set(os.listdir(dated_dir))
-                    except FileNotFoundError:
-                        after_files = set()
-                    new_files = after_files - before_files
-                    deleted = []
-                    for fname in new_files:
-                        if fname.startswith('recording_') and fname.endswith(f'.{config.OUTPUT_FORMAT}'):
-                            fpath = os.path.join(dated_dir, fname)
-                            try:
-                                os.remove(fpath)
-                                deleted.append(fname)
-                            except Exception as e:
-                                self.logger.warning(f"Failed removing file {fpath}: {e}")
-                    if deleted:
-                        self.logger.info(f"Removed {len(deleted)} failed/partial segment(s): {deleted}")
+                    self.remove_new_segments(output_file, before)
+
+                    # The dated directory may have been removed underneath us;
+                    # make sure the next attempt recreates it.
+                    self._last_date = None
 
                     # short backoff before restarting
-                    time.sleep(0.1)
+                    if self._stop_event.wait(0.1):
+                        break
                     continue
 
                 # If we reach here, ffmpeg produced at least one segment. Now wait
                 # for the process to end (normal operation) or restart on error.
-                self.process.wait(timeout=config.SEGMENT_DURATION + 0.5)
+                self.process.wait(timeout=self._process_timeout)
 
-                # process finished; collect stderr tail if any via implicit reader
+                # process finished; its stderr is already in ffmpeg.log
                 rc = self.process.returncode
                 if rc != 0 and not self.clean_shutdown:
                     # Only clean up segments if this was an actual error, not a clean shutdown
                     self.logger.error(f"FFmpeg process failed (rc={rc}) — will remove newly created segments and restart")
-                    try:
-                        after_files = set(os.listdir(dated_dir))
-                    except FileNotFoundError:
-                        after_files = set()
-                    new_files = after_files - before_files
-                    deleted = []
-                    for fname in new_files:
-                        if fname.startswith('recording_') and fname.endswith(f'.{config.OUTPUT_FORMAT}'):
-                            fpath = os.path.join(dated_dir, fname)
-                            try:
-                                os.remove(fpath)
-                                deleted.append(fname)
-                            except Exception as e:
-                                self.logger.warning(f"Failed removing file {fpath}: {e}")
-                    if deleted:
-                        self.logger.info(f"Removed {len(deleted)} failed/partial segment(s): {deleted}")
-                    else:
+                    self.log_ffmpeg_tail(rc)
+                    if not self.remove_new_segments(output_file, before):
                         self.logger.info("No new segment files found to remove after failure.")
+                    self._last_date = None
                 elif self.clean_shutdown:
                     self.logger.info("Clean shutdown requested, keeping recorded segments")
 
-                    time.sleep(5)
+                    if self._stop_event.wait(5):
+                        break
             except subprocess.TimeoutExpired:
-                self.logger.error(f"Timeout for process ({config.SEGMENT_DURATION + 0.5}s) expired. Terminating process...")
+                self.logger.error(f"Timeout for process ({self._process_timeout}s) expired. Terminating process...")
                 try:
                     self.process.terminate()  # Send SIGTERM
                     self.process.wait(timeout=1)  # Wait for the process to actually terminate for 1 second
@@ -327,12 +535,18 @@ class RTSPRecorder:
                     self.logger.info("Process killed.")
             except Exception as e:
                 self.logger.error(f"Error during recording: {str(e)}")
-                time.sleep(5)  # Wait before retrying
+                self._last_date = None
+                if self._stop_event.wait(5):  # Wait before retrying
+                    break
 
     def signal_handler(self, signum, frame):
         """Handle shutdown signals"""
         self.logger.info("Shutdown signal received, stopping recorder...")
         self.running = False
+        # Event.set() takes the Event's internal non-reentrant lock, which the
+        # interrupted main thread may be holding inside Event.wait(). Setting
+        # it from another thread avoids deadlocking on ourselves.
+        threading.Thread(target=self._stop_event.set, daemon=True).start()
         if self.process:
             # Signal a clean shutdown to avoid triggering error cleanup
             self.clean_shutdown = True
@@ -344,13 +558,14 @@ class RTSPRecorder:
 
     def validate_config(self):
         """Validate the configuration settings"""
-        if not os.path.exists(config.FFMPEG_BINARY):
-            raise ValueError(f"FFmpeg binary not found at {config.FFMPEG_BINARY}")
+        settings = self.settings
+        if not os.path.exists(self._ffmpeg_path):
+            raise ValueError(f"FFmpeg binary not found at {settings.ffmpeg_binary}")
         
-        if not config.RTSP_URL.startswith('rtsp://'):
+        if not settings.rtsp_url.startswith('rtsp://'):
             raise ValueError("Invalid RTSP URL format")
         
-        if config.SEGMENT_DURATION <= 0:
+        if settings.segment_duration <= 0:
             raise ValueError("Segment duration must be positive")
 
 def main():